@@ -70,7 +70,6 @@ def write_tim_file(tim_data_dict, out_path):
       - height: int, wysokość obrazu
       - new_pixel_data: bajtowy ciąg z danymi pikselowymi
     """
-    import struct
     with open(out_path, "wb") as f:
         f.write(tim_data_dict["header_id"])
         f.write(tim_data_dict["tim_format"])
@@ -110,33 +109,38 @@ class Tim_Object:
         self.pixel_data = tim_data["pixel_data"]
         self.pil_image = None
 
-    def decode(self):
+    def decode_pil(self):
         """
-        Decodes TIM data into a QPixmap.
+        Decodes TIM data into an RGBA PIL image (no Qt, safe to call from worker threads).
         """
-        clut_raw = np.frombuffer(self.clut_data, dtype=np.uint16)
-        clut_rgb = [((color & 0x1F) << 3, ((color >> 5) & 0x1F) << 3, ((color >> 10) & 0x1F) << 3)
-                    for color in clut_raw]
-        clut = np.array(clut_rgb, dtype=np.uint8)
-        img = Image.new("RGB", (self.pixel_data_width, self.pixel_data_height))
-        pixels = img.load()
+        clut_raw = np.frombuffer(self.clut_data, dtype="<u2")
+        clut = np.stack([(clut_raw & 0x1F) << 3,
+                         ((clut_raw >> 5) & 0x1F) << 3,
+                         ((clut_raw >> 10) & 0x1F) << 3], axis=-1).astype(np.uint8)
+        width, height = self.pixel_data_width, self.pixel_data_height
+        data = np.frombuffer(self.pixel_data, dtype=np.uint8)
         if self.format_flag == b'\x08\x00\x00\x00':
-            row_size = self.pixel_data_width // 2
-            for y in range(self.pixel_data_height):
-                for x in range(0, self.pixel_data_width, 2):
-                    byte = self.pixel_data[y * row_size + (x // 2)]
-                    index1 = byte & 0x0F
-                    index2 = (byte >> 4) & 0x0F
-                    pixels[x, y] = tuple(clut[index1])
-                    if x + 1 < self.pixel_data_width:
-                        pixels[x + 1, y] = tuple(clut[index2])
+            row_size = width // 2
+            packed = data[:height * row_size].reshape(height, row_size)
+            indexes = np.empty((height, width), dtype=np.uint8)
+            indexes[:, 0::2] = packed & 0x0F
+            indexes[:, 1::2] = packed >> 4
+            rgb = clut[indexes]
         elif self.format_flag == b'\x09\x00\x00\x00':
-            for y in range(self.pixel_data_height):
-                for x in range(self.pixel_data_width):
-                    color_index = self.pixel_data[y * self.pixel_data_width + x]
-                    pixels[x, y] = tuple(clut[color_index])
+            indexes = data[:height * width].reshape(height, width)
+            rgb = clut[indexes]
+        else:
+            rgb = np.zeros((height, width, 3), dtype=np.uint8)
+        img = Image.fromarray(rgb)
         pil_image = img.convert("RGBA")
         self.pil_image = pil_image
+        return pil_image
+
+    def decode(self):
+        """
+        Decodes TIM data into a QPixmap.
+        """
+        pil_image = self.decode_pil()
         data = pil_image.tobytes("raw", "RGBA")
         qimage = QImage(data, pil_image.width, pil_image.height, QImage.Format.Format_RGBA8888)
         return QPixmap.fromImage(qimage)
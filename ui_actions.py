@@ -6,10 +6,34 @@ Brak zależności od PyQt – czysta logika.
 """
 
 import os
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-from tim_operations import read_tim, Tim_Object
+import numpy as np
+from PIL import Image
+
+from tim_operations import read_tim, write_tim_file, Tim_Object
+
+# wątki do pracy mieszanej I/O + dekodowanie (odczyt TIM, zapis PNG)
+IO_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+# wątki do pracy obliczeniowej (kodowanie PNG -> TIM)
+CPU_MAX_WORKERS = os.cpu_count() or 1
+
+
+def results_in_order(futures):
+    """
+    Czeka na futures i zwraca ich wyniki w kolejności zgłoszenia.
+    Przy pierwszym błędzie anuluje zadania, które jeszcze nie wystartowały
+    (żeby nie zapisywać dalszych plików), i rzuca ten błąd dalej.
+    """
+    wait(futures, return_when=FIRST_EXCEPTION)
+    failed = [f for f in futures if f.done() and not f.cancelled() and f.exception() is not None]
+    if failed:
+        for future in futures:
+            future.cancel()
+        failed[0].result()
+    return [future.result() for future in futures]
 
 
 # ============================================================
@@ -29,11 +53,13 @@ def load_tim_files(folder_a: str) -> Dict[str, Tim_Object]:
     if not folder.is_dir():
         raise RuntimeError(f"Folder A does not exist: {folder_a}")
 
-    for file in folder.iterdir():
-        if file.suffix.lower() != ".tim":
-            continue
+    tim_files = [file for file in folder.iterdir() if file.suffix.lower() == ".tim"]
+
+    # odczyt równolegle, słownik budowany w wątku głównym (kontrola duplikatów)
+    with ThreadPoolExecutor(max_workers=IO_MAX_WORKERS) as pool:
+        tim_datas = list(pool.map(read_tim, [str(file) for file in tim_files]))
 
-        tim_data = read_tim(str(file))
+    for file, tim_data in zip(tim_files, tim_datas):
         tim_obj = Tim_Object(tim_data)
 
         key = file.stem
@@ -52,10 +78,45 @@ def load_tim_files(folder_a: str) -> Dict[str, Tim_Object]:
 # 2. Wczytanie PNG i sprawdzenie zgodności rozmiarów (Folder B)
 # ============================================================
 
+def png_stat_record(png_path: Path) -> np.ndarray:
+    """
+    Dokładny ślad pliku PNG: (st_size, st_mtime_ns). Samo porównanie mtime
+    nie wystarcza – kopiowanie z zachowaniem czasu (shutil.copy2, cp -p,
+    Eksplorator Windows) podmienia treść bez "nowszego" mtime.
+    """
+    st = png_path.stat()
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def load_exported_rgba(png_path: Path):
+    """
+    Zwraca obraz RGBA z <nazwa>.npz zapisanego obok PNG przez convert_tim_png
+    (bez dekodowania PNG), ale tylko jeśli zapisany w nim ślad PNG
+    (png_stat_record) dokładnie zgadza się z obecnym plikiem – każda podmiana
+    lub edycja PNG wymusza normalne dekodowanie. W przeciwnym razie None.
+
+    Uwaga: to cache w folderze roboczym – convert_tim_png zapisuje obok każdego
+    PNG nieskompresowany plik .npz (4 bajty na piksel).
+    """
+    npz_path = png_path.with_suffix(".npz")
+    try:
+        with np.load(npz_path) as cached:
+            if not np.array_equal(cached["png_stat"], png_stat_record(png_path)):
+                return None
+            arr = cached["rgba"]
+    except Exception:
+        # to tylko cache – uszkodzony/niedopisany plik (BadZipFile, EOFError, ...)
+        # oznacza po prostu normalne dekodowanie PNG
+        return None
+    if arr.dtype != np.uint8 or arr.ndim != 3 or arr.shape[2] != 4:
+        return None
+    return Image.fromarray(arr)
+
+
 def match_png_files(
     tim_objects: Dict[str, Tim_Object],
     folder_b: str
-) -> Dict[str, str]:
+) -> Dict[str, Tuple[str, Image.Image]]:
     """
     Dopasowuje PNG do TIM po nazwie.
     Sprawdza:
@@ -64,7 +125,11 @@ def match_png_files(
 
     Zwraca:
         key   = nazwa bazowa
-        value = ścieżka do PNG
+        value = (ścieżka do PNG, zdekodowany obraz RGBA, lub RGB dla PNG bez alfy)
+    Obraz jest dekodowany tylko raz – convert_png_tim używa go
+    zamiast ponownie otwierać plik. Jeśli obok PNG leży zrzut <nazwa>.npz
+    z convert_tim_png pasujący do tego PNG, PNG nie jest w ogóle dekodowany
+    (patrz load_exported_rgba).
     """
     png_map = {}
     folder = Path(folder_b)
@@ -72,22 +137,40 @@ def match_png_files(
     if not folder.is_dir():
         raise RuntimeError(f"Work folder does not exist: {folder_b}")
 
-    for name, tim in tim_objects.items():
-        png_path = folder / f"{name}.png"
+    try:
+        for name, tim in tim_objects.items():
+            png_path = folder / f"{name}.png"
 
-        if not png_path.exists():
-            raise RuntimeError(f"No PNG for {name}.tim")
+            if not png_path.exists():
+                raise RuntimeError(f"No PNG for {name}.tim")
 
-        # sprawdzenie rozmiaru
-        from PIL import Image
-        with Image.open(png_path) as img:
-            if img.size != (tim.pixel_data_width, tim.pixel_data_height):
+            tim_size = (tim.pixel_data_width, tim.pixel_data_height)
+            # pasujący zrzut .npz z convert_tim_png pozwala pominąć dekodowanie PNG
+            decoded = load_exported_rgba(png_path)
+            if decoded is not None:
+                png_size = decoded.size
+            else:
+                # sprawdzenie rozmiaru (z nagłówka, przed dekodowaniem pikseli)
+                with Image.open(png_path) as img:
+                    png_size = img.size
+                    if png_size == tim_size:
+                        # PNG bez przezroczystości zostaje w RGB (bez kanału alfa do odrzucenia);
+                        # RGB z kluczem koloru tRNS ("transparency") musi przejść na RGBA
+                        keep_rgb = img.mode == "RGB" and "transparency" not in img.info
+                        decoded = img.convert("RGB" if keep_rgb else "RGBA")
+
+            if png_size != tim_size:
                 raise RuntimeError(
                     f"Size of PNG not matching TIM for {name}: "
-                    f"PNG={img.size}, TIM=({tim.pixel_data_width},{tim.pixel_data_height})"
+                    f"PNG={png_size}, TIM=({tim.pixel_data_width},{tim.pixel_data_height})"
                 )
 
-        png_map[name] = str(png_path)
+            png_map[name] = (str(png_path), decoded)
+    except BaseException:
+        # nie trzymaj zdekodowanych obrazów, skoro wynik i tak nie powstanie
+        for _, img in png_map.values():
+            img.close()
+        raise
 
     return png_map
 
@@ -122,7 +205,7 @@ def group_by_clut_coords(
 
 def validate_group_palettes(
     groups: Dict[Tuple[bytes, int, int], List[str]],
-    png_map: Dict[str, str]
+    png_map: Dict[str, Tuple[str, Image.Image]]
 ):
     """
     Na tym etapie:
@@ -147,30 +230,30 @@ def validate_group_palettes(
 # 5. Główna funkcja wywoływana przez UI
 # ============================================================
 
-def convert_tim_png(folder_a: str, work_folder: str):
+def convert_tim_png(folder_a: str, work_folder: str, compress_level: int = 1):
     """
     Wczytaj wszystkie TIMy z folder_a i zapisz jako PNGy do work_folder
     o tych samych nazwach (basename.png). Zwraca listę zapisanych plików.
+    compress_level (0-9) to poziom zlib dla PNG – pliki robocze nie potrzebują
+    mocnej kompresji, a domyślne 6 zajmuje większość czasu eksportu.
+    Obok każdego PNG zapisywany jest też nieskompresowany cache <nazwa>.npz
+    (piksele RGBA + ślad PNG) – patrz load_exported_rgba.
     """
-    from PIL import Image
-
     tim_objects = load_tim_files(folder_a)  # wykorzystuje istniejącą funkcję
     out_dir = Path(work_folder)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    saved = []
-    for name, tim in tim_objects.items():
+    def export_one(name, tim):
         try:
             # upewnij się, że mamy PIL image w obiekcie Tim_Object
             pil_img = getattr(tim, "pil_image", None)
             if pil_img is None:
-                # decode() ustawi tim.pil_image i zwróci QPixmap (ale potrzebujemy pil_image)
-                # jeśli decode() nie istnieje / zachowuje się inaczej, rzućmy czytelny błąd
-                if hasattr(tim, "decode"):
-                    tim.decode()
-                    pil_img = getattr(tim, "pil_image", None)
+                # decode_pil() ustawi tim.pil_image i go zwróci; decode() (QPixmap)
+                # nie nadaje się do wątków roboczych, więc go tu nie używamy
+                if hasattr(tim, "decode_pil"):
+                    pil_img = tim.decode_pil()
                 else:
-                    raise RuntimeError("Tim_Object nie ma metody decode()")
+                    raise RuntimeError("Tim_Object nie ma metody decode_pil()")
 
             if pil_img is None:
                 raise RuntimeError(f"Nie udało się uzyskać obrazu PIL dla {name}")
@@ -178,86 +261,172 @@ def convert_tim_png(folder_a: str, work_folder: str):
             out_path = out_dir / (name + ".png")
             # Upewnij się, że zapisujemy PIL Image (RGBA) jako PNG
             if isinstance(pil_img, Image.Image):
-                pil_img.save(out_path, "PNG")
+                pil_img.save(out_path, "PNG", compress_level=compress_level, optimize=False)
+                # zrzut pikseli + ślad zapisanego PNG – convert_png_tim użyje go
+                # zamiast dekodować PNG, o ile PNG nie został od tej pory zmieniony
+                # (zapis pod nazwą tymczasową + os.replace – przerwany eksport
+                # nie zostawia pod docelową ścieżką połowy pliku)
+                npz_path = out_path.with_suffix(".npz")
+                tmp_path = out_path.with_suffix(".npz.tmp")
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, rgba=np.asarray(pil_img), png_stat=png_stat_record(out_path))
+                os.replace(tmp_path, npz_path)
             else:
                 # jeśli pil_img jest QImage/QPixmap (nie powinno się zdarzyć w obecnej implementacji),
                 # spróbujmy skonwertować przez bytes (rzadki kod ścieżki)
                 raise RuntimeError(f"Obiekt pil_image dla {name} nie jest PIL.Image (typ={type(pil_img)})")
 
-            saved.append(str(out_path))
+            return str(out_path)
         except Exception as e:
             # przerwij i zgłoś błąd — zgodnie z Twoim wymaganiem, żeby zatrzymać przy niezgodnościach
             raise RuntimeError(f"Failed to export TIM -> PNG for '{name}': {e}") from e
 
+    # zapis PNG (zlib) zwalnia GIL – eksport równolegle, wyniki w kolejności wejścia;
+    # pierwszy błąd anuluje eksporty, które jeszcze nie wystartowały
+    with ThreadPoolExecutor(max_workers=IO_MAX_WORKERS) as pool:
+        futures = [pool.submit(export_one, name, tim) for name, tim in tim_objects.items()]
+        saved = results_in_order(futures)
+
     # opcjonalnie zwróć listę zapisanych plików
     return saved
 
 
+# cache palet grup: klucz = ((ścieżka, rozmiar, mtime), ...) + palette_size
+_GROUP_PALETTE_CACHE = {}
+_GROUP_PALETTE_CACHE_MAX = 64
 
-# na górze pliku ui_actions.py (jeśli jeszcze nie ma tych importów), dodaj:
-from PIL import Image
-from tim_operations import write_tim_file
-import struct
 
-# ---- helper: compute_group_palette (mozaika miniaturek + PIL.quantize MEDIANCUT) ----
-def compute_group_palette(png_paths: List[str], palette_size: int) -> List[tuple]:
+# ---- helper: compute_group_palette (piksele miniaturek + PIL.quantize MEDIANCUT) ----
+def compute_group_palette(
+    png_paths: List[str],
+    palette_size: int,
+    images: List[Image.Image] = None
+) -> np.ndarray:
     """
-    Z PNG-ów (ścieżki) buduje mozaikę miniaturek i kwantyzuje ją metodą MEDIANCUT,
-    zwracając listę (r,g,b) długości palette_size.
+    Z PNG-ów (ścieżki) zbiera piksele miniaturek i kwantyzuje je metodą MEDIANCUT,
+    zwracając tablicę (palette_size, 3) uint8 kolorów (r,g,b), dopełnioną czernią.
     Deterministyczne i szybkie dla naszych celów.
+
+    images (opcjonalnie) to już zdekodowane obrazy w kolejności png_paths
+    (np. z match_png_files) – wtedy PNG nie są dekodowane ponownie,
+    a obrazy nie są tu zamykane.
+
+    Wynik jest zapamiętywany (tylko do odczytu) dla tego samego zestawu plików
+    i palette_size, dopóki żaden PNG nie zmieni śladu (png_stat_record: rozmiar
+    i mtime, jak przy cache .npz) – kolejne konwersje w tej samej sesji UI
+    nie kwantyzują ponownie.
     """
+    # kolejność nie ma wpływu na wynik – ten sam zestaw = ta sama paleta
+    if images is None:
+        images = [None] * len(png_paths)
+    order = sorted(range(len(png_paths)), key=lambda i: png_paths[i])
+    png_paths = [png_paths[i] for i in order]
+    images = [images[i] for i in order]
+    cache_key = (
+        tuple((p, *png_stat_record(Path(p)).tolist()) for p in png_paths),
+        palette_size,
+    )
+    cached = _GROUP_PALETTE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     thumbs = []
     max_thumb_dim = 128
-    for p in png_paths:
-        im = Image.open(p).convert("RGBA")
+    max_samples = 50_000
+    for p, im in zip(png_paths, images):
+        opened = im is None
+        if opened:
+            im = load_exported_rgba(Path(p))
+            if im is None:
+                im = Image.open(p).convert("RGBA")
         w, h = im.size
         scale = min(1.0, max_thumb_dim / max(w, h))
-        tw = max(1, int(w * scale))
-        th = max(1, int(h * scale))
-        thumbs.append(im.resize((tw, th), Image.Resampling.LANCZOS).convert("RGB"))
-        im.close()
-
-    # ułóż miniatury w wiersze o max szerokości ~1024px
-    max_row_w = 1024
-    rows = []
-    cur_row = []
-    cur_w = 0
-    cur_h = 0
-    for t in thumbs:
-        tw, th = t.size
-        if cur_row and (cur_w + tw > max_row_w):
-            rows.append((cur_row, cur_h))
-            cur_row = [t]
-            cur_w = tw
-            cur_h = th
+        if scale >= 1.0:
+            # już mała tekstura – skalowanie nic nie daje
+            thumbs.append(im.convert("RGB"))
         else:
-            cur_row.append(t)
-            cur_w += tw
-            cur_h = max(cur_h, th)
-    if cur_row:
-        rows.append((cur_row, cur_h))
-
-    mosaic_w = max(sum(img.size[0] for img in row[0]) for row in rows)
-    mosaic_h = sum(row[1] for row in rows)
-    mosaic = Image.new("RGB", (mosaic_w, mosaic_h), (0, 0, 0))
-    y = 0
-    for row, row_h in rows:
-        x = 0
-        for img in row:
-            mosaic.paste(img, (x, y))
-            x += img.size[0]
-        y += row_h
-
-    pal_img = mosaic.quantize(colors=palette_size, method=Image.MEDIANCUT)
+            tw = max(1, int(w * scale))
+            th = max(1, int(h * scale))
+            # do statystyki palety BILINEAR wystarcza (LANCZOS jest dużo droższy)
+            thumbs.append(im.resize((tw, th), Image.Resampling.BILINEAR).convert("RGB"))
+        if opened:
+            im.close()
+
+    # układ przestrzenny nie ma znaczenia dla statystyki kolorów – zamiast
+    # wklejać miniatury w mozaikę, sklejamy ich piksele w jeden pasek (N x 1)
+    stacked = np.concatenate([np.asarray(t).reshape(-1, 3) for t in thumbs], axis=0)
+    # koszt median cut rośnie z liczbą pikseli – dla palety wystarczy próbka;
+    # stały krok zamiast losowania, żeby wynik był deterministyczny
+    if len(stacked) > max_samples:
+        step = -(-len(stacked) // max_samples)  # ceil – najwyżej max_samples pikseli
+        stacked = stacked[::step]
+    strip = Image.fromarray(stacked.reshape(-1, 1, 3))
+
+    pal_img = strip.quantize(colors=palette_size, method=Image.MEDIANCUT)
     flat = pal_img.getpalette() or []
-    palette = []
-    for i in range(0, min(len(flat), palette_size * 3), 3):
-        palette.append((flat[i], flat[i + 1], flat[i + 2]))
-    if len(palette) < palette_size:
-        palette += [(0, 0, 0)] * (palette_size - len(palette))
+    found = np.frombuffer(bytes(flat[:palette_size * 3]), dtype=np.uint8).reshape(-1, 3)
+    palette = np.zeros((palette_size, 3), dtype=np.uint8)
+    palette[:len(found)] = found
+    palette.setflags(write=False)
+
+    if len(_GROUP_PALETTE_CACHE) >= _GROUP_PALETTE_CACHE_MAX:
+        _GROUP_PALETTE_CACHE.pop(next(iter(_GROUP_PALETTE_CACHE)))
+    _GROUP_PALETTE_CACHE[cache_key] = palette
     return palette
 
 
+# ---- helper: nearest_palette_indexes (najbliższy kolor palety, NumPy/BLAS) ----
+def palette_sq_norms(pal: np.ndarray) -> np.ndarray:
+    """
+    Kwadraty norm kolorów palety (K,) – liczone raz na grupę
+    i przekazywane do nearest_palette_indexes.
+    """
+    pal = pal.astype(np.float32)
+    return (pal * pal).sum(1)
+
+
+def nearest_palette_indexes(
+    pixels: np.ndarray,
+    pal: np.ndarray,
+    pal_sq: np.ndarray = None,
+    chunk_size: int = 4096
+) -> np.ndarray:
+    """
+    Dla pikseli (N,3) zwraca indeksy (N,) uint8 najbliższych kolorów palety (K,3)
+    (odległość euklidesowa w RGB, przy remisie wygrywa niższy indeks).
+
+    |p - q|^2 = |p|^2 + |q|^2 - 2 p·q, więc iloczyn p·q to jedno mnożenie
+    macierzy (BLAS). |p|^2 nie zmienia argmin po palecie, więc jest pomijane.
+    Wartości całkowite < 2^24, więc float32 liczy tu dokładnie.
+    Liczone w kawałkach po chunk_size pikseli (tablica pośrednia chunk x K).
+
+    Wyszukiwanie jest dokładne – Image.quantize(palette=...) jest szybsze,
+    ale jego cache palety bierze tylko 6 górnych bitów kanału i zmienia
+    indeksy części pikseli, więc nie jest tu używane.
+    """
+    pal = pal.astype(np.float32)
+    if pal_sq is None:
+        pal_sq = palette_sq_norms(pal)
+    pal_t = np.ascontiguousarray(pal.T)
+    indexes = np.empty(len(pixels), dtype=np.uint8)
+    for start in range(0, len(pixels), chunk_size):
+        pix = pixels[start:start + chunk_size].astype(np.float32)
+        d2 = pal_sq[None, :] - 2.0 * (pix @ pal_t)
+        indexes[start:start + chunk_size] = d2.argmin(axis=1)
+    return indexes
+
+
+# ---- helper: pack_4bpp (dwa indeksy 4-bit w jednym bajcie) ----
+def pack_4bpp(indexes: np.ndarray, w: int, h: int) -> bytes:
+    """
+    Pakuje indeksy (w*h,) do formatu TIM 4bpp: piksel parzysty w młodszym
+    półbajcie, nieparzysty w starszym. Szerokość musi być parzysta.
+    """
+    idx = indexes.reshape(h, w) & 0x0F
+    packed = (idx[:, 1::2] << 4) | idx[:, 0::2]
+    return packed.astype(np.uint8).tobytes()
+
+
 # ---- główna funkcja: convert_png_tim ----
 def convert_png_tim(folder_a: str, folder_b: str, out_folder: str):
     """
@@ -274,26 +443,14 @@ def convert_png_tim(folder_a: str, folder_b: str, out_folder: str):
     out_path_dir = Path(out_folder)
     out_path_dir.mkdir(parents=True, exist_ok=True)
 
-    saved = []
-
-    # process groups
-    for key, names in groups.items():
-        fmt_flag, clut_x, clut_y = key
-        palette_size = 16 if fmt_flag == b'\x08\x00\x00\x00' else 256
-
-        # collect PNG paths for this group
-        png_paths = [png_map[name] for name in names]
-
-        # compute one palette for entire group
-        group_palette = compute_group_palette(png_paths, palette_size)
-
-        # For each name in group map & encode
-        for name in names:
-            tim_obj = tim_objects[name]  # Tim_Object
-            png_file = png_map[name]
-
-            # open PIL RGBA
-            src = Image.open(png_file).convert("RGBA")
+    # map & encode one PNG (independent once its group palette is known – the
+    # NumPy work releases the GIL, so threads scale); group data comes in as
+    # arguments so one pool can serve all groups
+    def encode_one(name, fmt_flag, palette_size, group_palette, pal_sq, clut_u16):
+        tim_obj = tim_objects[name]  # Tim_Object
+        # RGB/RGBA image already decoded by match_png_files
+        png_file, src = png_map[name]
+        try:
             # ensure size matches (match_png_files already checked, but double-check)
             if src.size != (tim_obj.pixel_data_width, tim_obj.pixel_data_height):
                 raise RuntimeError(f"Size of PNG {png_file} != TIM {name} -> abort")
@@ -303,67 +460,35 @@ def convert_png_tim(folder_a: str, folder_b: str, out_folder: str):
                 out_dict = tim_obj.encode_from_pil(src, group_palette, transparent_threshold=128)
             except AttributeError:
                 # fallback: ręczne mapowanie (nearest + pakowanie)
-                # map pixels to palette (RGB)
-                img_rgb = src.convert("RGB")
-                pixels = list(img_rgb.getdata())
-                # precompute palette array
-                pal = group_palette
-
-                def nearest_index(px):
-                    pr, pg, pb = px
-                    best_i = 0
-                    br, bg, bb = pal[0]
-                    best_d = (pr - br) ** 2 + (pg - bg) ** 2 + (pb - bb) ** 2
-                    for i in range(1, len(pal)):
-                        r, g, b = pal[i]
-                        d = (pr - r) ** 2 + (pg - g) ** 2 + (pb - b) ** 2
-                        if d < best_d:
-                            best_d = d
-                            best_i = i
-                    return best_i
-
-                indexes = [nearest_index(px) & 0xFF for px in pixels]
+                # map pixels to palette (RGB) – exact nearest colour, NumPy/BLAS;
+                # one (N, 3|4) view of the image serves both colour and alpha
+                pixels = np.asarray(src).reshape(-1, len(src.getbands()))
+                indexes = nearest_palette_indexes(pixels[:, :3], group_palette, pal_sq)
                 # transparency
-                alpha = src.split()[3]
-                mask = [a < 128 for a in alpha.getdata()]
-                for i, m in enumerate(mask):
-                    if m:
-                        indexes[i] = 0
+                if src.mode == "RGBA":
+                    indexes[pixels[:, 3] < 128] = 0
 
                 # build pixel bytes
                 if fmt_flag == b'\x09\x00\x00\x00':  # 8bpp
-                    pixel_bytes = bytes([int(v) & 0xFF for v in indexes])
+                    pixel_bytes = indexes.tobytes()
                     stored_width_value = tim_obj.pixel_data_width // 2
                 else:  # 4bpp
                     w = tim_obj.pixel_data_width
                     h = tim_obj.pixel_data_height
                     if w % 2 != 0:
                         raise RuntimeError(f"Width must be even for 4bpp (file {name})")
-                    outb = bytearray()
-                    for y in range(h):
-                        row_start = y * w
-                        for x in range(0, w, 2):
-                            i1 = indexes[row_start + x] & 0x0F
-                            i2 = indexes[row_start + x + 1] & 0x0F
-                            outb.append((i2 << 4) | i1)
-                    pixel_bytes = bytes(outb)
+                    pixel_bytes = pack_4bpp(indexes, w, h)
                     stored_width_value = tim_obj.pixel_data_width // 4
 
                 # build clut bytes and pad to expected entries
                 clut_expected = tim_obj.clut_size_x * tim_obj.clut_size_y
                 if clut_expected == 0:
                     clut_expected = palette_size
-                clut_bytes = bytearray()
-                for (r, g, b) in group_palette:
-                    val = ((r >> 3) & 0x1F) | (((g >> 3) & 0x1F) << 5) | (((b >> 3) & 0x1F) << 10)
-                    clut_bytes += struct.pack("<H", val)
-                # pad or trim
-                if len(clut_bytes) < clut_expected * 2:
-                    last = clut_bytes[-2:] if len(clut_bytes) >= 2 else struct.pack("<H", 0)
-                    while len(clut_bytes) < clut_expected * 2:
-                        clut_bytes += last
-                elif len(clut_bytes) > clut_expected * 2:
-                    clut_bytes = clut_bytes[:clut_expected * 2]
+                # pad (repeat last entry) or trim
+                clut_entries = clut_u16[:clut_expected]
+                if len(clut_entries) < clut_expected:
+                    clut_entries = np.pad(clut_entries, (0, clut_expected - len(clut_entries)), mode="edge")
+                clut_bytes = clut_entries.tobytes()
 
                 new_clut_bnum = len(clut_bytes) + 12
                 new_pixel_bnum = len(pixel_bytes) + 12
@@ -376,7 +501,7 @@ def convert_png_tim(folder_a: str, folder_b: str, out_folder: str):
                     "clut_coord_y": tim_obj.clut_coord_y,
                     "clut_size_x": tim_obj.clut_size_x,
                     "clut_size_y": tim_obj.clut_size_y,
-                    "common_clut": bytes(clut_bytes),
+                    "common_clut": clut_bytes,
                     "new_pixel_bnum": new_pixel_bnum,
                     "pixel_coord_x": tim_obj.pixel_coord_x,
                     "pixel_coord_y": tim_obj.pixel_coord_y,
@@ -389,10 +514,55 @@ def convert_png_tim(folder_a: str, folder_b: str, out_folder: str):
             out_filename = os.path.join(out_folder, name + ".tim")
             try:
                 write_tim_file(out_dict, out_filename)
-                saved.append(out_filename)
             except Exception as e:
                 raise RuntimeError(f"Failed to write TIM for {name}: {e}") from e
-            finally:
-                src.close()
+            return out_filename
+        finally:
+            # zwolnij obraz od razu – match_png_files trzyma wszystkie zdekodowane PNG
+            src.close()
+
+    try:
+        futures = []
+        with ThreadPoolExecutor(max_workers=CPU_MAX_WORKERS) as pool:
+            try:
+                # process groups – one pool for all of them, so single-TIM groups
+                # (distinct CLUT coords) still run in parallel
+                for key, names in groups.items():
+                    fmt_flag, clut_x, clut_y = key
+                    palette_size = 16 if fmt_flag == b'\x08\x00\x00\x00' else 256
+
+                    # collect PNG paths (cache key) and images decoded by match_png_files
+                    png_paths = [png_map[name][0] for name in names]
+                    images = [png_map[name][1] for name in names]
+
+                    # compute one palette for entire group
+                    group_palette = compute_group_palette(png_paths, palette_size, images)
+                    pal_sq = palette_sq_norms(group_palette)
+                    # RGB555 CLUT entries for the whole group
+                    clut_u16 = (
+                        (group_palette[:, 0] >> 3).astype(np.uint16)
+                        | ((group_palette[:, 1] >> 3).astype(np.uint16) << 5)
+                        | ((group_palette[:, 2] >> 3).astype(np.uint16) << 10)
+                    ).astype("<u2")
+
+                    # queue this group's encodes; stop queueing once one has failed
+                    futures += [
+                        pool.submit(encode_one, name, fmt_flag, palette_size, group_palette, pal_sq, clut_u16)
+                        for name in names
+                    ]
+                    if any(f.done() and not f.cancelled() and f.exception() is not None for f in futures):
+                        break
+
+                # keep input order; stop queued encodes on the first failure
+                saved = results_in_order(futures)
+            except BaseException:
+                # e.g. palette of a later group failed – don't write queued TIMs
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        # przy wcześniejszym błędzie część obrazów nie trafiła do encode_one
+        for _, img in png_map.values():
+            img.close()
 
     return saved